@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from vllm.entrypoints.openai.api_server import batch_sse_stream
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _collect(generator):
+    return [batch async for batch in generator]
+
+
+async def test_content_preserved_in_order():
+
+    async def gen():
+        for i in range(20):
+            yield f"data: {i}\n\n"
+
+    batches = await _collect(batch_sse_stream(gen(), 0.02, 8192))
+    assert "".join(batches) == "".join(f"data: {i}\n\n" for i in range(20))
+
+
+async def test_flush_on_byte_bound():
+    # A tiny byte budget forces one batch per frame, without any delay.
+    async def gen():
+        yield "a"
+        yield "b"
+        yield "c"
+
+    batches = await _collect(batch_sse_stream(gen(), 60., 1))
+    assert batches == ["a", "b", "c"]
+
+
+async def test_flush_on_deadline():
+    # The first frame must be flushed alone once max_delay elapses, even
+    # though the second frame is still pending.
+    async def gen():
+        yield "a"
+        await asyncio.sleep(0.2)
+        yield "b"
+
+    batches = await _collect(batch_sse_stream(gen(), 0.02, 8192))
+    assert batches[0] == "a"
+    assert "".join(batches) == "ab"
+
+
+async def test_cancellation_closes_inner_generator():
+    waiting = asyncio.Event()
+    closed = asyncio.Event()
+
+    async def gen():
+        try:
+            yield "a"
+            waiting.set()
+            await asyncio.sleep(60)
+            yield "b"
+        finally:
+            closed.set()
+
+    async def consume():
+        async for _ in batch_sse_stream(gen(), 0.01, 8192):
+            pass
+
+    task = asyncio.ensure_future(consume())
+    await waiting.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert closed.is_set()
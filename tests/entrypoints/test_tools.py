@@ -0,0 +1,61 @@
+import orjson
+
+from vllm.entrypoints.openai.protocol import VllmToolsTemplate
+from vllm.entrypoints.openai.tools import (ChatPromptCapture,
+                                           OpenAIToolsPrompter)
+
+
+def _make_capture() -> ChatPromptCapture:
+    prompter = OpenAIToolsPrompter(privileged=False)
+    return ChatPromptCapture(prompter, VllmToolsTemplate())
+
+
+def test_make_calls_list_with_call_tokens():
+    # Streaming path: the accumulated content keeps the call tokens.
+    capture = _make_capture()
+    capture.content = (
+        '<tool_call>{ "name": "get_weather", "arguments": {"city": "Paris"} }'
+        '</tool_call>\n'
+        '<tool_call>{ "name": "get_time", "arguments": null }</tool_call>')
+    capture.make_calls_list()
+    assert [call.name
+            for call in capture.calls_list] == ["get_weather", "get_time"]
+    assert capture.calls_list[0].arguments == {"city": "Paris"}
+    assert capture.calls_list[1].arguments is None
+
+
+def test_make_calls_list_bare_json():
+    # Non-streaming path: chat_completion_full_generator extracts the brace
+    # block without any call token around it.
+    capture = _make_capture()
+    capture.content = ('{ "name": "get_weather", '
+                       '"arguments": {"city": "Paris"} }')
+    capture.make_calls_list()
+    assert capture.num_calls() == 1
+    assert capture.calls_list[0].name == "get_weather"
+    assert capture.calls_list[0].arguments == {"city": "Paris"}
+
+
+def test_make_calls_list_ignores_invalid_json():
+    capture = _make_capture()
+    capture.content = "<tool_call>{ not json }</tool_call>"
+    capture.make_calls_list()
+    assert capture.num_calls() == 0
+
+
+def test_to_tool_call_lists():
+    capture = _make_capture()
+    capture.content = ('<tool_call>{ "name": "get_weather", '
+                       '"arguments": {"city": "Paris"} }</tool_call>')
+    capture.make_calls_list()
+
+    messages = capture.to_ChatCompletionMessageToolCallList()
+    assert len(messages) == 1
+    assert messages[0].id == "call_get_weather_0"
+    assert messages[0].type == "function"
+    assert orjson.loads(messages[0].function.arguments) == {"city": "Paris"}
+
+    deltas = capture.to_ChoiceDeltaToolCallList()
+    assert len(deltas) == 1
+    assert deltas[0].id == messages[0].id
+    assert deltas[0].function == messages[0].function
@@ -1,20 +1,23 @@
 import argparse
 import asyncio
 import json
-from contextlib import asynccontextmanager
+import time
+from contextlib import asynccontextmanager, suppress
 import os
 import sys
 import importlib
 import inspect
+from typing import Dict
 
-from prometheus_client import make_asgi_app
+from prometheus_client import Counter, Histogram, REGISTRY, make_asgi_app
 import fastapi
 import uvicorn
+import uvloop
 from http import HTTPStatus
 from fastapi import Request
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse, Response
 
 import vllm
 from vllm.engine.arg_utils import AsyncEngineArgs
@@ -27,29 +30,226 @@ from vllm.entrypoints.openai.serving_engine import LoRA
 from vllm.entrypoints.openai.tools import OpenAIToolsPrompter
 
 TIMEOUT_KEEP_ALIVE = 5  # seconds
+_LOG_STATS_INTERVAL = 10  # seconds
 
-vllm_engine: AsyncLLMEngine = None
-vllm_engine_args = None
-openai_serving_chat: OpenAIServingChat = None
-openai_serving_completion: OpenAIServingCompletion = None
+args = None
+served_model: str = None
+_tools_prompter_cache: Dict[bool, OpenAIToolsPrompter] = {}
+stream_batch_delay: float = 0.02  # seconds, see --stream-batch-ms
+stream_batch_max_bytes: int = 8192  # see --stream-batch-bytes
 logger = init_logger(__name__)
 
 
+async def batch_sse_stream(generator, max_delay: float, max_bytes: int):
+    """ Coalesce SSE frames into time/size-bounded batches.
+        The generators yield one frame per token; at high concurrency the
+        per-frame ASGI send() overhead dominates when tokens arrive faster
+        than the event loop can flush them. A frame is never delayed by
+        more than max_delay seconds. """
+    loop = asyncio.get_running_loop()
+    gen = generator.__aiter__()
+    pending = None
+    deadline = None
+    buffer = []
+    buffered_bytes = 0
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(gen.__anext__())
+            timeout = None if deadline is None else max(
+                0., deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:  # Deadline reached: flush, keep the frame pending.
+                yield "".join(buffer)
+                buffer = []
+                buffered_bytes = 0
+                deadline = None
+                continue
+            pending = None
+            try:
+                frame = done.pop().result()
+            except StopAsyncIteration:
+                break
+            if deadline is None:
+                deadline = loop.time() + max_delay
+            buffer.append(frame)
+            buffered_bytes += len(frame)
+            if buffered_bytes >= max_bytes:
+                yield "".join(buffer)
+                buffer = []
+                buffered_bytes = 0
+                deadline = None
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        # On cancellation (client disconnect), asyncio.wait leaves the
+        # __anext__ task running: reap it and close the inner generator so
+        # the engine request is aborted deterministically instead of
+        # waiting on asyncgen GC finalization.
+        if pending is not None:
+            pending.cancel()
+            with suppress(asyncio.CancelledError, StopAsyncIteration):
+                await pending
+        if hasattr(gen, "aclose"):
+            await gen.aclose()
+
+
+def _maybe_batch_sse(generator):
+    if stream_batch_delay > 0.:
+        return batch_sse_stream(generator, stream_batch_delay,
+                                stream_batch_max_bytes)
+    return generator
+
+
 @asynccontextmanager
 async def lifespan(app: fastapi.FastAPI):
+    state = llm_app.state
+    # The lock is created here so it binds to the serving event loop.
+    state.reload_lock = asyncio.Lock()
 
-    async def _force_log():
-        while True:
-            await asyncio.sleep(10)
-            await vllm_engine.do_log_stats()
+    def _force_log():
+        # Use the loop's timer heap directly instead of keeping a coroutine
+        # alive between ticks: no persistent frame, no stray await stealing
+        # cycles from token streaming.
+        asyncio.create_task(state.engine.do_log_stats())
+        loop.call_later(_LOG_STATS_INTERVAL, _force_log)
 
-    if not vllm_engine_args.disable_log_stats:
-        asyncio.create_task(_force_log())
+    if not state.engine_args.disable_log_stats:
+        loop = asyncio.get_running_loop()
+        loop.call_later(_LOG_STATS_INTERVAL, _force_log)
 
     yield
 
 
-app = fastapi.FastAPI(lifespan=lifespan)
+app = fastapi.FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# The latency-critical LLM endpoints live on a dedicated sub-application so
+# that middlewares needed by them alone (e.g. the API-key check) are not paid
+# by the /health, /metrics and dev endpoints of the outer application.
+llm_app = fastapi.FastAPI(default_response_class=ORJSONResponse)
+
+# The mutable service state lives on the sub-application rather than in
+# module globals: the handlers reach it through request.app.state.
+llm_app.state.engine = None
+llm_app.state.engine_args = None
+llm_app.state.chat = None
+llm_app.state.completion = None
+
+
+def _register_metric(metric_cls, name: str, documentation: str, labelnames):
+    """ Create the metric, or reuse the registered collector if the module
+        body runs twice in one process (e.g. re-imported under another name
+        by multiprocessing spawn). """
+    try:
+        return metric_cls(name=name,
+                          documentation=documentation,
+                          labelnames=labelnames)
+    except ValueError:
+        return REGISTRY._names_to_collectors[name]
+
+
+class ASGIMetricsMiddleware:
+    """ Pure ASGI middleware recording per-request HTTP metrics.
+        Unlike a BaseHTTPMiddleware, it does not allocate Request/Response
+        objects nor spawn an extra task per request, which matters on the
+        streaming endpoints. """
+
+    counter_requests = _register_metric(
+        Counter,
+        name="vllm:http_requests_total",
+        documentation="Number of HTTP requests received by the API server.",
+        labelnames=["method", "path", "status"])
+    histogram_request_duration = _register_metric(
+        Histogram,
+        name="vllm:http_request_duration_seconds",
+        documentation="Duration of the HTTP requests.",
+        labelnames=["method", "path"])
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        path = scope["path"]
+        start_time = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                self.counter_requests.labels(method=method,
+                                             path=path,
+                                             status=str(
+                                                 message["status"])).inc()
+                self.histogram_request_duration.labels(
+                    method=method,
+                    path=path).observe(time.perf_counter() - start_time)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+app.add_middleware(ASGIMetricsMiddleware)
+
+
+class WildcardCORSMiddleware:
+    """ Minimal pure-ASGI CORS handler for the default wildcard
+        configuration (allow_origins=["*"] without credentials). It spares
+        the header processing of the full CORSMiddleware on every request
+        and short-circuits the preflights. """
+
+    PREFLIGHT_HEADERS = [
+        (b"access-control-allow-origin", b"*"),
+        (b"access-control-allow-methods", b"*"),
+        (b"access-control-allow-headers", b"*"),
+        (b"access-control-max-age", b"600"),
+    ]
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if scope["method"] == "OPTIONS" and any(
+                name == b"access-control-request-method"
+                for name, _ in scope["headers"]):
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": self.PREFLIGHT_HEADERS
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append(
+                    (b"access-control-allow-origin", b"*"))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+class ApiKeyAuthMiddleware:
+    """ Pure ASGI bearer-token check for the /v1 sub-application. """
+
+    def __init__(self, app, api_key: str):
+        self.app = app
+        self.auth_header = b"Bearer " + api_key.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"authorization" and value == self.auth_header:
+                    break
+            else:
+                response = ORJSONResponse(content={"error": "Unauthorized"},
+                                          status_code=401)
+                return await response(scope, receive, send)
+        await self.app(scope, receive, send)
 
 
 class LoRAParserAction(argparse.Action):
@@ -144,6 +344,17 @@ def parse_args():
         type=str,
         default=None,
         help="FastAPI root_path when app is behind a path based routing proxy")
+    parser.add_argument("--stream-batch-ms",
+                        type=float,
+                        default=20.,
+                        help="Maximum delay in milliseconds when batching "
+                        "streamed SSE chunks. Set to 0 to send every "
+                        "token individually.")
+    parser.add_argument("--stream-batch-bytes",
+                        type=int,
+                        default=8192,
+                        help="Flush the batched SSE chunks once this many "
+                        "bytes are buffered.")
     parser.add_argument(
         "--middleware",
         type=str,
@@ -164,40 +375,45 @@ def _loadServingServices():
     """ Load or reload the OpenAI service.
         This function should only be called once on initialization, but may be called to reload the API internals.
         Reloading must be used for development purpose only. """
-    global openai_serving_chat
-    global openai_serving_completion
-    if openai_serving_chat is not None:
-        del openai_serving_chat
-    if openai_serving_completion is not None:
-        del openai_serving_completion
-
-    openai_tools_prompter = OpenAIToolsPrompter(privileged=args.privileged
-    ) if args.enable_api_tools else None
-    openai_serving_chat = OpenAIServingChat(
-        engine=vllm_engine,
-        served_model=served_model,
-        response_role=args.response_role,
-        lora_modules=args.lora_modules,
-        chat_template=args.chat_template,
-        openai_tools_prompter=openai_tools_prompter,
-        privileged=args.privileged)
-
-    openai_serving_completion = OpenAIServingCompletion(
-        vllm_engine, served_model, args.lora_modules)
+    state = llm_app.state
+
+    if args.enable_api_tools:
+        # Reuse the prompter across /privileged reloads so its rendered
+        # tools-prompt cache survives.
+        openai_tools_prompter = _tools_prompter_cache.setdefault(
+            args.privileged, OpenAIToolsPrompter(privileged=args.privileged))
+    else:
+        openai_tools_prompter = None
+    state.chat = OpenAIServingChat(engine=state.engine,
+                                   served_model=served_model,
+                                   response_role=args.response_role,
+                                   lora_modules=args.lora_modules,
+                                   chat_template=args.chat_template,
+                                   openai_tools_prompter=openai_tools_prompter,
+                                   privileged=args.privileged)
+
+    state.completion = OpenAIServingCompletion(state.engine, served_model,
+                                               args.lora_modules)
 
 
 # Add prometheus asgi middleware to route /metrics requests
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
 
+# Mount the LLM routes. The sub-application handlers are registered below.
+app.mount("/v1", llm_app)
+
 
 @app.exception_handler(RequestValidationError)
+@llm_app.exception_handler(RequestValidationError)
 async def validation_exception_handler(req: Request, exc: Exception):
     if "--privileged" in sys.argv:
-        logger.warning("Request error (headers) : %s" % str(dict(req.headers)))
-        logger.warning("Request error (body) : %s" % str((await req.body()).decode("utf-8")))
-    err = openai_serving_chat.create_error_response(message=str(exc))
-    return JSONResponse(err.model_dump(), status_code=HTTPStatus.BAD_REQUEST)
+        logger.warning("Request error (headers) : %s", dict(req.headers))
+        logger.warning("Request error (body) : %s",
+                       (await req.body()).decode("utf-8"))
+    err = llm_app.state.chat.create_error_response(message=str(exc))
+    return ORJSONResponse(err.model_dump(mode="json"),
+                          status_code=HTTPStatus.BAD_REQUEST)
 
 
 @app.get("/health")
@@ -212,72 +428,84 @@ if "--privileged" in sys.argv:
     async def privileged() -> Response:
         """Reload the API internals. Danger !"""
         logger.warning("privileged called.")
-        _loadServingServices()
+        async with llm_app.state.reload_lock:
+            _loadServingServices()
         return Response(status_code=200)
 
 
-@app.get("/v1/models")
-async def show_available_models():
-    models = await openai_serving_chat.show_available_models()
-    return JSONResponse(content=models.model_dump())
+@llm_app.get("/models")
+async def show_available_models(raw_request: Request):
+    models = await raw_request.app.state.chat.show_available_models()
+    return ORJSONResponse(content=models.model_dump(mode="json"))
 
 
 @app.get("/version")
 async def show_version():
     ver = {"version": vllm.__version__}
-    return JSONResponse(content=ver)
+    return ORJSONResponse(content=ver)
 
 
-@app.post("/v1/chat/completions")
+@llm_app.post("/chat/completions")
 async def create_chat_completion(request: ChatCompletionRequest,
                                  raw_request: Request):
-    generator = await openai_serving_chat.create_chat_completion(
+    generator = await raw_request.app.state.chat.create_chat_completion(
         request, raw_request)
     if isinstance(generator, ErrorResponse):
-        return JSONResponse(content=generator.model_dump(),
-                            status_code=generator.code)
+        return ORJSONResponse(content=generator.model_dump(mode="json"),
+                              status_code=generator.code)
     if request.stream:
-        return StreamingResponse(content=generator,
+        # The generator must be a native async iterator: Starlette offloads
+        # plain sync iterators to a threadpool, which is dramatically slower.
+        assert hasattr(generator, "__aiter__")
+        return StreamingResponse(content=_maybe_batch_sse(generator),
                                  media_type="text/event-stream")
     else:
-        return JSONResponse(content=generator.model_dump())
+        return ORJSONResponse(content=generator.model_dump(mode="json"))
 
 
-@app.post("/v1/completions")
+@llm_app.post("/completions")
 async def create_completion(request: CompletionRequest, raw_request: Request):
-    generator = await openai_serving_completion.create_completion(
+    generator = await raw_request.app.state.completion.create_completion(
         request, raw_request)
     if isinstance(generator, ErrorResponse):
-        return JSONResponse(content=generator.model_dump(),
-                            status_code=generator.code)
+        return ORJSONResponse(content=generator.model_dump(mode="json"),
+                              status_code=generator.code)
     if request.stream:
-        return StreamingResponse(content=generator,
+        # The generator must be a native async iterator: Starlette offloads
+        # plain sync iterators to a threadpool, which is dramatically slower.
+        assert hasattr(generator, "__aiter__")
+        return StreamingResponse(content=_maybe_batch_sse(generator),
                                  media_type="text/event-stream")
     else:
-        return JSONResponse(content=generator.model_dump())
-
-
-if __name__ == "__main__":
-    args = parse_args()
-
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=args.allowed_origins,
-        allow_credentials=args.allow_credentials,
-        allow_methods=args.allowed_methods,
-        allow_headers=args.allowed_headers,
-    )
+        return ORJSONResponse(content=generator.model_dump(mode="json"))
+
+
+def _configure_app(parsed_args):
+    """ Apply the CLI-driven configuration to the ASGI applications. """
+    global args
+    global served_model
+    global stream_batch_delay
+    global stream_batch_max_bytes
+    args = parsed_args
+
+    if (args.allowed_origins == ["*"] and args.allowed_methods == ["*"]
+            and args.allowed_headers == ["*"] and not args.allow_credentials):
+        # The default wildcard configuration does not need the full
+        # CORSMiddleware machinery on every request.
+        app.add_middleware(WildcardCORSMiddleware)
+    else:
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=args.allowed_origins,
+            allow_credentials=args.allow_credentials,
+            allow_methods=args.allowed_methods,
+            allow_headers=args.allowed_headers,
+        )
 
     if token := os.environ.get("VLLM_API_KEY") or args.api_key:
-
-        @app.middleware("http")
-        async def authentication(request: Request, call_next):
-            if not request.url.path.startswith("/v1"):
-                return await call_next(request)
-            if request.headers.get("Authorization") != "Bearer " + token:
-                return JSONResponse(content={"error": "Unauthorized"},
-                                    status_code=401)
-            return await call_next(request)
+        # Attached to the /v1 sub-application only: the hot path skips the
+        # path-prefix test and /health and /metrics stay unauthenticated.
+        llm_app.add_middleware(ApiKeyAuthMiddleware, api_key=token)
 
     for middleware in args.middleware:
         module_path, object_name = middleware.rsplit(".", 1)
@@ -291,8 +519,11 @@ if __name__ == "__main__":
                 f"Invalid middleware {middleware}. Must be a function or a class."
             )
 
-    logger.info(f"vLLM API server version {vllm.__version__}")
-    logger.info(f"args: {args}")
+    logger.info("vLLM API server version %s", vllm.__version__)
+    logger.info("args: %s", args)
+
+    stream_batch_delay = args.stream_batch_ms / 1000.
+    stream_batch_max_bytes = args.stream_batch_bytes
 
     if args.privileged:
         logger.warning(
@@ -308,16 +539,31 @@ if __name__ == "__main__":
     else:
         served_model = args.model
 
-    vllm_engine_args = AsyncEngineArgs.from_cli_args(args)
-    vllm_engine = AsyncLLMEngine.from_engine_args(vllm_engine_args)
+    app.root_path = args.root_path
+
+
+def _initialize_engine():
+    """ Instantiate the engine and the serving services. """
+    state = llm_app.state
+    state.engine_args = AsyncEngineArgs.from_cli_args(args)
+    state.engine = AsyncLLMEngine.from_engine_args(state.engine_args)
     _loadServingServices()
 
 
-    app.root_path = args.root_path
+if __name__ == "__main__":
+    _configure_app(parse_args())
+    _initialize_engine()
+
+    # uvloop roughly doubles the raw event loop throughput, which directly
+    # benefits the streaming endpoints. httptools is the C-accelerated HTTP
+    # parser from uvicorn[standard]. The API does not use websockets.
+    uvloop.install()
     uvicorn.run(app,
                 host=args.host,
                 port=args.port,
                 log_level=args.uvicorn_log_level,
                 timeout_keep_alive=TIMEOUT_KEEP_ALIVE,
+                http="httptools",
+                ws="none",
                 ssl_keyfile=args.ssl_keyfile,
                 ssl_certfile=args.ssl_certfile)
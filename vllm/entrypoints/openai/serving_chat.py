@@ -72,7 +72,10 @@ class OpenAIServingChat(OpenAIServing):
             else:
                 # No need to allocate it for each requests, if this param is not set, we use the default value.
                 request.tool_params = self.default_tools_template
-            self.openai_tools_prompter.inject_prompt(request)
+            if request.tools:
+                # Only the prompt injection depends on the tools list: a
+                # follow-up turn may post tool results without re-sending it.
+                self.openai_tools_prompter.inject_prompt(request)
 
             # FIXME : As on dec 2023, the tokenizer only accept "role" and "content" attributes.
             # FIXME : So we manually copy other attributes into "content" when needed.
@@ -165,7 +168,8 @@ class OpenAIServingChat(OpenAIServing):
         else:
             is_tools_guided_generation = False
             if self.openai_tools_prompter is not None and (
-                    isinstance(request.tool_choice, str)
+                    request.tools is not None
+                    and isinstance(request.tool_choice, str)
                     and request.tool_choice == "auto"):
                 tools_capture_texts = [
                     ChatPromptCapture(self.openai_tools_prompter,
@@ -287,10 +291,10 @@ class OpenAIServingChat(OpenAIServing):
                             if len(current_capture.content) == 0:
                                 current_token: str = output.text[
                                     len(previous_texts[i]):]
-                                if current_capture.func_call_token_pre(
-                                ) in current_token:
+                                if current_capture.func_call_token_pre \
+                                        in current_token:
                                     start_pos: int = current_token.index(
-                                        current_capture.func_call_token_pre())
+                                        current_capture.func_call_token_pre)
                                     current_capture.content = current_token[
                                         start_pos:]  # With some models the completion may start by a space.
                                     current_capture.prefix_size = len(
@@ -304,12 +308,12 @@ class OpenAIServingChat(OpenAIServing):
                                 current_capture.content += current_token
                                 if len(
                                         current_capture.content
-                                ) < current_capture.func_call_token_size():
+                                ) < current_capture.func_call_token_size:
                                     pass
                                 elif not current_capture.is_function_call:
                                     if current_capture.content.startswith(
-                                            current_capture.func_call_token(
-                                            )):  # Function call !
+                                            current_capture.func_call_token
+                                    ):  # Function call !
                                         current_capture.is_function_call = True
                                     else:  # This is not a function call...
                                         current_capture.reset(False)
@@ -466,16 +470,15 @@ class OpenAIServingChat(OpenAIServing):
                 else:
                     start_pos = 0
                     while True:
-                        pos = output.text.find(
-                            current_capture.func_call_token(), start_pos, -1)
+                        pos = output.text.find(current_capture.func_call_token,
+                                               start_pos, -1)
                         if pos < 0:
                             break
                         start_bloc = output.text.find("{", pos, -1)
                         if start_bloc < 0:
                             break
                         if (start_bloc -
-                            (pos +
-                             current_capture.func_call_token_size())) > 1:
+                            (pos + current_capture.func_call_token_size)) > 1:
                             break
                         count = 1
                         bloc_end = start_bloc + 1
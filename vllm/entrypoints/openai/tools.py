@@ -1,5 +1,8 @@
-import json
-from typing import List, Dict, Union
+import hashlib
+import re
+import orjson
+from collections import OrderedDict
+from typing import Any, List, Dict, NamedTuple, Union
 from vllm.logger import init_logger
 from vllm.entrypoints.openai.protocol import (
     ChatCompletionRequest, ChatCompletionToolParam, VllmToolsTemplate,
@@ -10,6 +13,14 @@ from vllm.entrypoints.openai.protocol import (
 logger = init_logger(__name__)
 
 
+class ParsedToolCall(NamedTuple):
+    """ A function call extracted from the model output.
+        Lighter than the raw decoded dict and accessed by fixed offset
+        instead of hash lookup. """
+    name: str
+    arguments: Any
+
+
 class ToolsCallsTemplate:
     """ This template system is only used when the tool_choice is set to "auto" """
 
@@ -18,20 +29,27 @@ class ToolsCallsTemplate:
 
     def render_toolcalls(self, tool_calls: [ChatCompletionMessageToolCall],
                          tool_params: VllmToolsTemplate) -> str:
-        instructions = ""
+        instructions = []
         if len(tool_params.tool_call_notif_noarg_start) or len(
                 tool_params.tool_call_notif_noarg_end):
             for call in tool_calls:
                 if call.function.arguments is None or len(
                         call.function.arguments) == 0:
-                    instructions += tool_params.tool_call_notif_noarg_start + " " + call.id + " " + tool_params.tool_call_notif_noarg_end + "\n"
+                    instructions.append(
+                        tool_params.tool_call_notif_noarg_start + " " +
+                        call.id + " " + tool_params.tool_call_notif_noarg_end +
+                        "\n")
                 else:
-                    instructions += tool_params.tool_call_notif_args_start + " " + call.id + " " + tool_params.tool_call_notif_noarg_end + "\n"
-        return instructions
+                    instructions.append(
+                        tool_params.tool_call_notif_args_start + " " +
+                        call.id + " " + tool_params.tool_call_notif_noarg_end +
+                        "\n")
+        return "".join(instructions)
 
     def render_toolresponse(self, message: ChatCompletionToolMessage,
                             tool_params: VllmToolsTemplate) -> str:
-        return tool_params.response_token_start + str(message.content) + tool_params.response_token_end + "\n"
+        return tool_params.response_token_start + str(
+            message.content) + tool_params.response_token_end + "\n"
 
     def render_tool(self, tool: ChatCompletionToolParam,
                     tool_params: VllmToolsTemplate) -> str:
@@ -54,18 +72,19 @@ class ToolsCallsTemplate:
             for tool in tools_list:
                 # Search if the tool_choice is in the tools_list
                 if tool.type == "function" and tool.function.name == tool_choice:
-                    instructions = tool_params.function_guided + "\n" + self.render_tool(
-                        tool, tool_params=tool_params) + "\n"
-                    instructions += tool_params.function_call_instruct
-                    return instructions
+                    return "".join((tool_params.function_guided, "\n",
+                                    self.render_tool(tool,
+                                                     tool_params=tool_params),
+                                    "\n", tool_params.function_call_instruct))
             return ""  # Tool not found. What should we do ?
         else:
-            instructions = tool_params.function_list_start + "\n"
+            instructions = [tool_params.function_list_start + "\n"]
             for tool in tools_list:
-                instructions += self.render_tool(tool, tool_params=tool_params)
-            instructions += "\n" + tool_params.function_list_end + "\n"
-            instructions += tool_params.function_call_instruct
-            return instructions
+                instructions.append(
+                    self.render_tool(tool, tool_params=tool_params))
+            instructions.append("\n" + tool_params.function_list_end + "\n")
+            instructions.append(tool_params.function_call_instruct)
+            return "".join(instructions)
 
 
 class OpenAIToolsPrompter:
@@ -73,9 +92,13 @@ class OpenAIToolsPrompter:
     https://platform.openai.com/docs/assistants/tools
     """
 
+    # Maximum number of rendered tools prompts kept in the LRU cache.
+    RENDER_CACHE_SIZE = 1024
+
     def __init__(self, privileged: bool):
         self.privileged = privileged
         self.template = ToolsCallsTemplate()
+        self._render_cache: "OrderedDict[str, str]" = OrderedDict()
 
     def content_from_assistant(self, message: ChatCompletionAssistantMessage,
                                tool_params: VllmToolsTemplate) -> str:
@@ -91,6 +114,30 @@ class OpenAIToolsPrompter:
         return self.template.render_toolresponse(message,
                                                  tool_params=tool_params)
 
+    def _render_toolslist_cached(self, tool_choice: Union[str, None],
+                                 tools_list: [ChatCompletionToolParam],
+                                 tool_params: VllmToolsTemplate) -> str:
+        """ Memoize the rendered tools prompt. A server usually exposes a
+            fixed function catalogue, so re-rendering it on every request
+            is wasted CPU in the hot request path. """
+        key = hashlib.blake2b(orjson.dumps([
+            tool_choice, [tool.dict() for tool in tools_list],
+            tool_params.dict()
+        ],
+                                           option=orjson.OPT_SORT_KEYS),
+                              digest_size=16).hexdigest()
+        rendered = self._render_cache.get(key)
+        if rendered is not None:
+            self._render_cache.move_to_end(key)
+            return rendered
+        rendered = self.template.render_toolslist(tool_choice=tool_choice,
+                                                  tools_list=tools_list,
+                                                  tool_params=tool_params)
+        self._render_cache[key] = rendered
+        if len(self._render_cache) > self.RENDER_CACHE_SIZE:
+            self._render_cache.popitem(last=False)
+        return rendered
+
     def inject_prompt(self, request: ChatCompletionRequest):
         """ Generate and inject the prompt for tools calls. """
         if request.tools is not None and len(request.tools):
@@ -102,20 +149,31 @@ class OpenAIToolsPrompter:
                     select_tool_choice = None
             else:
                 select_tool_choice = None
-            text_inject = self.template.render_toolslist(
+            text_inject = self._render_toolslist_cached(
                 tool_choice=select_tool_choice,
                 tools_list=request.tools,
                 tool_params=request.tool_params)
+            # str.join goes through the PyUnicode_Join fast path and avoids
+            # the intermediate string a chained + would allocate, which
+            # matters with large system prompts.
             if isinstance(request.messages, str):
-                request.messages = text_inject + "\n\n" + request.messages
+                request.messages = "".join(
+                    (text_inject, "\n\n", request.messages))
             elif isinstance(request.messages,
                             List) and len(request.messages) >= 1:
-                request.messages[
-                    0].content = text_inject + "\n\n" + request.messages[
-                        0].content
+                request.messages[0].content = "".join(
+                    (text_inject, "\n\n", request.messages[0].content))
 
 
 class ChatPromptCapture:
+    # One instance is allocated per streamed generation and reset() is
+    # called on every captured function call: slot descriptors make both
+    # cheaper than __dict__ stores and cut the per-instance memory.
+    __slots__ = ("content", "prompter", "maybe_function_call",
+                 "is_function_call", "prefix_size", "calls_list",
+                 "after_new_function_call", "named_function_call",
+                 "tool_params", "_call_token_re", "func_call_token",
+                 "func_call_token_pre", "func_call_token_size")
 
     def __init__(self, prompter: OpenAIToolsPrompter,
                  tool_params: VllmToolsTemplate):
@@ -124,10 +182,23 @@ class ChatPromptCapture:
         self.maybe_function_call = False
         self.is_function_call = False
         self.prefix_size = 0
-        self.calls_list: List[{}] = []
+        self.calls_list: List[ParsedToolCall] = []
         self.after_new_function_call = False
         self.named_function_call = False  # True if the function call is forced using request.tool_choice
         self.tool_params = tool_params
+        self._call_token_re = re.compile(
+            re.escape(tool_params.call_token_start)
+        ) if tool_params is not None else None
+        # Plain attributes rather than methods: they are read from the tight
+        # per-token decoding loop in serving_chat.py.
+        if tool_params is not None:
+            self.func_call_token = tool_params.call_token_start
+            self.func_call_token_pre = tool_params.call_token_start[0]
+            self.func_call_token_size = len(tool_params.call_token_start)
+        else:
+            self.func_call_token = ""
+            self.func_call_token_pre = ""
+            self.func_call_token_size = 0
 
     def __str__(self):
         """ Show current state. For debugging purpose. """
@@ -150,18 +221,6 @@ class ChatPromptCapture:
         if reset_calls_list:
             self.calls_list = []
 
-    def func_call_token_pre(self) -> str:
-        return self.tool_params.call_token_start[0]
-        # return self.call_token_pre
-
-    def func_call_token_size(self) -> int:
-        return len(self.tool_params.call_token_start)
-        # return len(self.call_token_str)
-
-    def func_call_token(self) -> str:
-        return self.tool_params.call_token_start
-        # return self.call_token_str
-
     def num_calls(self):
         return len(self.calls_list)
 
@@ -199,21 +258,34 @@ class ChatPromptCapture:
             if self._add_calls_list(self.content) == 0:
                 return
         else:
-            calls_list = self.content.split(self.tool_params.call_token_start)
-            for v_call in calls_list:
-                if len(self.tool_params.call_token_end):
-                    content = v_call.split(self.tool_params.call_token_end)[0]
-                else:
-                    content = v_call
-                self._add_calls_list(content)
+            # Scan with a precompiled pattern and slice between the matches
+            # rather than str.split, which would allocate every fragment of
+            # the accumulated content at once. The leading segment is
+            # processed too: the non-streaming path extracts bare brace
+            # blocks without any call token in front.
+            call_token_end = self.tool_params.call_token_end
+            fragment_start = 0
+            for match in self._call_token_re.finditer(self.content):
+                self._add_calls_fragment(
+                    self.content[fragment_start:match.start()], call_token_end)
+                fragment_start = match.end()
+            self._add_calls_fragment(self.content[fragment_start:],
+                                     call_token_end)
+
+    def _add_calls_fragment(self, fragment: str, call_token_end: str):
+        if len(call_token_end):
+            end_pos = fragment.find(call_token_end)
+            if end_pos != -1:
+                fragment = fragment[:end_pos]
+        self._add_calls_list(fragment)
 
     def _add_calls_list(self, content: str) -> int:
         """ Returns the number of added tools calls. """
         count = len(self.calls_list)
         if len(content) > 1:
             try:
-                call_data = json.loads(content)
-            except json.decoder.JSONDecodeError as exc:
+                call_data = orjson.loads(content)
+            except orjson.JSONDecodeError as exc:
                 # Simply ignore invalid functions calls...
                 if self.named_function_call:
                     logger.warning(
@@ -221,61 +293,72 @@ class ChatPromptCapture:
                         % str(exc))
                 else:
                     logger.warning(
-                        "Error in parsing the function call. The model have probably generated a wrong synthax : %s" % str(exc))
+                        "Error in parsing the function call. The model have probably generated a wrong synthax : %s"
+                        % str(exc))
                 return 0
             if isinstance(call_data, List):
                 for call_elem in call_data:
                     if isinstance(call_elem, Dict):
                         if "name" in call_elem:
-                            self.calls_list.append(call_elem)
+                            self.calls_list.append(self._parse_call(call_elem))
             elif isinstance(call_data, Dict):
                 if "name" in call_data:
-                    self.calls_list.append(call_data)
+                    self.calls_list.append(self._parse_call(call_data))
             if self.prompter.privileged:
                 logger.info("Catched tool call : %s" % str(call_data))
         return len(self.calls_list) - count
 
+    @staticmethod
+    def _parse_call(call_data: Dict) -> ParsedToolCall:
+        arguments = call_data.get("arguments")
+        if arguments is None:
+            arguments = call_data.get("parameters")
+        return ParsedToolCall(name=call_data["name"], arguments=arguments)
+
+    @staticmethod
+    def _build_function(call: ParsedToolCall) -> Function:
+        return Function(name=call.name,
+                        arguments=orjson.dumps(call.arguments).decode()
+                        if call.arguments is not None else "")
+
+    def _build_tool_call(
+            self, call_id: int,
+            call: ParsedToolCall) -> ChatCompletionMessageToolCall:
+        return ChatCompletionMessageToolCall(
+            index=call_id,
+            id="call_" + call.name + "_" + str(call_id),
+            type="function",
+            function=self._build_function(call))
+
+    def _build_delta_tool_call(self, call_id: int,
+                               call: ParsedToolCall) -> ChoiceDeltaToolCall:
+        return ChoiceDeltaToolCall(index=call_id,
+                                   id="call_" + call.name + "_" + str(call_id),
+                                   type="function",
+                                   function=self._build_function(call))
+
     def to_ChatCompletionMessageToolCall(
             self, call_id: int) -> Union[ChatCompletionMessageToolCall, None]:
         if len(self.calls_list) and call_id < len(self.calls_list):
-            call = self.calls_list[call_id]
-            arguments = call["arguments"] if "arguments" in call else None
-            if arguments is None and "parameters" in call:
-                arguments = call["parameters"]
-            function_call = Function(name=call["name"],
-                                     arguments=json.dumps(arguments)
-                                     if arguments is not None else "")
-            return ChatCompletionMessageToolCall(index=call_id,
-                                                 id="call_" + call["name"] +
-                                                 "_" + str(call_id),
-                                                 type="function",
-                                                 function=function_call)
+            return self._build_tool_call(call_id, self.calls_list[call_id])
         return None
 
     def to_ChatCompletionMessageToolCallList(
             self) -> List[ChatCompletionMessageToolCall]:
-        calls_count = self.num_calls()
-        tools_calls_list = []
-        for call_id in range(calls_count):
-            tools_calls_list.append(
-                self.to_ChatCompletionMessageToolCall(call_id=call_id))
-        return tools_calls_list
+        return [
+            self._build_tool_call(call_id, call)
+            for call_id, call in enumerate(self.calls_list)
+        ]
 
     def to_ChoiceDeltaToolCall(
             self, call_id: int) -> Union[ChoiceDeltaToolCall, None]:
-        mesg = self.to_ChatCompletionMessageToolCall(call_id)
-        if mesg is not None:
-            return ChoiceDeltaToolCall(index=call_id,
-                                       id=mesg.id,
-                                       type=mesg.type,
-                                       function=mesg.function)
+        if len(self.calls_list) and call_id < len(self.calls_list):
+            return self._build_delta_tool_call(call_id,
+                                               self.calls_list[call_id])
         return None
 
-    def to_ChoiceDeltaToolCallList(
-            self) -> List[Union[ChoiceDeltaToolCall, None]]:
-        calls_count = self.num_calls()
-        tools_calls_list = []
-        for call_id in range(calls_count):
-            tools_calls_list.append(
-                self.to_ChoiceDeltaToolCall(call_id=call_id))
-        return tools_calls_list
+    def to_ChoiceDeltaToolCallList(self) -> List[ChoiceDeltaToolCall]:
+        return [
+            self._build_delta_tool_call(call_id, call)
+            for call_id, call in enumerate(self.calls_list)
+        ]